@@ -1,3 +1,9 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Tuple
+
+logger = logging.getLogger(__name__)
+
 USER_ACITVITY_COUNTRY_LIST = [
     "Worldwide",
     "Brazil",
@@ -13,3 +19,18 @@ USER_ACITVITY_COUNTRY_LIST = [
     "United Kingdom",
     "United States",
 ]
+
+
+def upload_blobs(bucket, blobs: Iterable[Tuple[str, bytes]]):
+    """Upload (blob name, JSON payload) pairs to a GCS bucket concurrently."""
+    blobs = list(blobs)
+
+    def upload(blob_name, payload):
+        blob = bucket.blob(blob_name)
+        blob.upload_from_string(payload, content_type="application/json")
+        logger.info(f"Uploaded {blob.size} bytes to {bucket.name}/{blob.name}")
+
+    with ThreadPoolExecutor(max_workers=len(blobs)) as executor:
+        futures = [executor.submit(upload, *blob) for blob in blobs]
+        for future in futures:
+            future.result()
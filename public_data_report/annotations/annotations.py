@@ -1,12 +1,14 @@
 import datetime
-import json
+import functools
 import logging
+from typing import Any, Dict, List
 
 import click
 import importlib.resources as pkg_resources
+import orjson
 from google.cloud import bigquery, storage
 
-from public_data_report import USER_ACITVITY_COUNTRY_LIST
+from public_data_report import USER_ACITVITY_COUNTRY_LIST, upload_blobs
 from public_data_report.annotations import static
 
 logging.basicConfig(level=logging.INFO)
@@ -27,8 +29,8 @@ DEFAULT_USAGE_ANNOTATIONS = [
 ]
 
 
-def get_fxhealth_annotations(date_to: datetime.datetime) -> str:
-    """Return JSON string of annotations for Firefox versions per country."""
+def get_fxhealth_annotations(date_to: datetime.datetime) -> bytes:
+    """Return UTF-8 encoded JSON of annotations for Firefox versions per country."""
     client = bigquery.Client()
 
     QUERY = f"""
@@ -72,32 +74,54 @@ def get_fxhealth_annotations(date_to: datetime.datetime) -> str:
     """
 
     query_job = client.query(QUERY)
-    rows = query_job.result()
+    versions = query_job.result().to_arrow(create_bqstorage_client=True)
+
+    # Every country gets the same version annotations, so build the list once
+    # and share it; it is only read by the serializer.
+    # NUMERIC versions come back from Arrow as Decimal('100.000000000'), format the
+    # integer part only so the annotation stays "FF100".
+    version_annotations = [
+        {
+            "annotation": {"pct_latest_version": f"FF{int(version)}"},
+            "date": day,
+        }
+        for day, version in zip(
+            versions.column("day").to_pylist(), versions.column("version").to_pylist()
+        )
+    ]
+    fxhealth_annotations = {
+        country: version_annotations for country in USER_ACITVITY_COUNTRY_LIST
+    }
 
-    fxhealth_annotations = {country: [] for country in USER_ACITVITY_COUNTRY_LIST}
-    for row in rows:
-        for country in USER_ACITVITY_COUNTRY_LIST:
-            fxhealth_annotations[country].append(
-                {
-                    "annotation": {"pct_latest_version": f"FF{row['version']}"},
-                    "date": row["day"],
-                }
-            )
+    return orjson.dumps(fxhealth_annotations, option=orjson.OPT_INDENT_2)
 
-    return json.dumps(fxhealth_annotations, indent=2)
 
+@functools.lru_cache(maxsize=None)
+def _read_static_annotations(filename: str) -> bytes:
+    """Return the raw contents of a packaged static annotations file.
 
-def get_usage_annotations() -> str:
-    """Return JSON string of annotations for Firefox usage per country."""
-    usage_annotations = json.loads(
-        pkg_resources.read_text(static, WEBUSAGE_ANNOTATIONS_FILE)
-    )
+    Cached as bytes so that callers parse their own copy and can mutate it freely.
+    """
+    return pkg_resources.read_binary(static, filename)
+
+
+def _build_usage_annotations() -> Dict[str, List[Dict[str, Any]]]:
+    """Return annotations for Firefox usage per country."""
+    usage_annotations = orjson.loads(_read_static_annotations(WEBUSAGE_ANNOTATIONS_FILE))
     for country in USER_ACITVITY_COUNTRY_LIST:
         if country not in usage_annotations:
             usage_annotations[country] = []
         usage_annotations[country].extend(DEFAULT_USAGE_ANNOTATIONS)
 
-    return json.dumps(usage_annotations, indent=2, sort_keys=True)
+    return usage_annotations
+
+
+def get_usage_annotations() -> bytes:
+    """Return UTF-8 encoded JSON of annotations for Firefox usage per country."""
+    return orjson.dumps(
+        _build_usage_annotations(),
+        option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS,
+    )
 
 
 @click.command()
@@ -116,25 +140,17 @@ def main(date_to, output_bucket, output_prefix):
 
     usage_annotations_json = get_usage_annotations()
 
-    hardware_annotations_json = pkg_resources.read_text(
-        static, HARDWARE_ANNOTATIONS_FILE
-    )
+    hardware_annotations_json = _read_static_annotations(HARDWARE_ANNOTATIONS_FILE)
 
     storage_client = storage.Client()
-    bucket = storage_client.get_bucket(output_bucket)
-    for json_data, filename in [
-        (fxhealth_annotations_json, FXHEALTH_ANNOTATIONS_FILE),
-        (usage_annotations_json, WEBUSAGE_ANNOTATIONS_FILE),
-        (hardware_annotations_json, HARDWARE_ANNOTATIONS_FILE),
-    ]:
-        blob_static_annotation = bucket.blob(f"{output_prefix}/{filename}")
-        blob_static_annotation.upload_from_string(
-            json_data, content_type="application/json"
-        )
-        logging.info(
-            f"Uploaded {blob_static_annotation.size} bytes to "
-            f"{bucket.name}/{blob_static_annotation.name}"
-        )
+    upload_blobs(
+        storage_client.get_bucket(output_bucket),
+        [
+            (f"{output_prefix}/{FXHEALTH_ANNOTATIONS_FILE}", fxhealth_annotations_json),
+            (f"{output_prefix}/{WEBUSAGE_ANNOTATIONS_FILE}", usage_annotations_json),
+            (f"{output_prefix}/{HARDWARE_ANNOTATIONS_FILE}", hardware_annotations_json),
+        ],
+    )
 
 
 if __name__ == "__main__":
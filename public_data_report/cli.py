@@ -1,18 +1,40 @@
+import importlib
+
 import click
 
-from .hardware_report import hardware_report
-from .user_activity import user_activity
-from .annotations import annotations
 
+class LazyGroup(click.Group):
+    """Click group that imports a subcommand's module only when it is used.
 
-@click.group()
-def entry_point():
-    pass
+    Keeps `annotations` and `user_activity` runs from paying for the imports
+    of every other job.
+    """
+
+    def __init__(self, *args, lazy_subcommands=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # subcommand name -> "module:attribute" of its click command
+        self.lazy_subcommands = lazy_subcommands or {}
 
+    def list_commands(self, ctx):
+        return sorted(set(super().list_commands(ctx)) | set(self.lazy_subcommands))
 
-entry_point.add_command(hardware_report.main, "hardware_report")
-entry_point.add_command(user_activity.main, "user_activity")
-entry_point.add_command(annotations.main, "annotations")
+    def get_command(self, ctx, cmd_name):
+        if cmd_name in self.lazy_subcommands:
+            module_name, command_name = self.lazy_subcommands[cmd_name].split(":")
+            return getattr(importlib.import_module(module_name), command_name)
+        return super().get_command(ctx, cmd_name)
+
+
+@click.group(
+    cls=LazyGroup,
+    lazy_subcommands={
+        "hardware_report": "public_data_report.hardware_report.hardware_report:main",
+        "user_activity": "public_data_report.user_activity.user_activity:main",
+        "annotations": "public_data_report.annotations.annotations:main",
+    },
+)
+def entry_point():
+    pass
 
 
 if __name__ == "__main__":
@@ -1,21 +1,87 @@
-import json
+import functools
+import hashlib
 import logging
-from collections import defaultdict
+import os
+from collections import defaultdict, deque
 from datetime import datetime, timedelta
-from typing import Dict, Tuple, List, Any
+from typing import Dict, Tuple, List, Any, Iterable, Mapping
 
 import click
+import orjson
 import requests
+from google.api_core.exceptions import NotFound
 from google.cloud import bigquery, storage
 
+from public_data_report import upload_blobs
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+GPU_VENDOR_MAP = {
+    "0x1013": "Cirrus Logic",
+    "0x1002": "AMD",
+    "0x8086": "Intel",
+    "Intel Open Source Technology Center": "Intel",
+    "0x5333": "S3 Graphics",
+    "0x1039": "SIS",
+    "0x1106": "VIA",
+    "0x10de": "NVIDIA",
+    "0x102b": "Matrox",
+    "0x15ad": "VMWare",
+    "0x80ee": "Oracle VirtualBox",
+    "0x1414": "Microsoft Basic",
+    "0x106b": "Apple",
+}
+
+# (browser_arch, is Windows running under WOW64) -> OS arch
+OS_ARCH_MAP = {
+    # If it's a 64bit browser build, then we're on a 64bit system.
+    ("x86-64", False): "x86-64",
+    ("x86-64", True): "x86-64",
+    # If we're on Windows, with a 32bit browser build, and |isWow64 = true|,
+    # then we're on a 64 bit system.
+    ("x86", False): "x86",
+    ("x86", True): "x86-64",
+    ("aarch64", False): "aarch64",
+    ("aarch64", True): "x86-64",
+}
+
+DEVICE_MAP_URIS = (
+    "https://github.com/jrmuizel/gpu-db/raw/master/intel.json",
+    "https://github.com/jrmuizel/gpu-db/raw/master/nvidia.json",
+    "https://github.com/jrmuizel/gpu-db/raw/master/amd.json",
+)
+FETCH_CACHE_DIR = os.path.expanduser("~/.cache/firefox-public-data-report")
+
+# Load jobs to the output table that may run at once. Each one modifies a partition
+# of the same table, which BigQuery rate limits per table.
+MAX_PENDING_LOAD_JOBS = 4
+
+# Dimensions whose values are published as-is by transform_dimensions
+UNTRANSFORMED_DIMENSIONS = (
+    "os",
+    "browser_arch",
+    "cpu_cores",
+    "cpu_vendor",
+    "resolution",
+    "memory_gb",
+    "has_flash",
+    "cpu_speed",
+)
+
+# Low-cardinality dimensions to not create an "Other" bucket for in collapse_buckets
+UNCOLLAPSED_DIMENSIONS = frozenset(("has_flash", "os_arch"))
+
 
 def get_aggregation_query(source_table: str):
     """
-    Generates a query to get a single row with a column for each hardware dimension.
+    Generates a query to get a row per week with a column for each hardware dimension.
     Each column contains an array of hardware values and client counts.
+
+    Weeks are given by the @dates_from array parameter, each covering
+    [date_from, date_from + 7), so a backfill runs as a single query job.
+    The source table is filtered on date_from directly so that only the
+    requested partitions are scanned.
     """
     output_fields: Dict[str, Tuple[str]] = {
         "os": ("os",),
@@ -31,59 +97,117 @@ def get_aggregation_query(source_table: str):
         "gfx0_model": ("gfx0_vendor_id", "gfx0_device_id"),
     }
 
-    expr_template = (
-        "ARRAY(SELECT AS STRUCT {dimensions}, SUM(client_count) AS client_count "
-        f"FROM {source_table} "
-        "WHERE date_from = @date_from AND date_to = @date_to "
-        "GROUP BY {dimensions}) AS {field}"
+    cte_template = (
+        "{field}_counts AS ("
+        "SELECT date_from, ARRAY_AGG(STRUCT({dimensions}, client_count)) AS {field} "
+        "FROM (SELECT date_from, {dimensions}, SUM(client_count) AS client_count "
+        "FROM source GROUP BY date_from, {dimensions}) "
+        "GROUP BY date_from)"
     )
 
-    return f"""
-    SELECT
-      DATE(@date_from) AS date_from,
-      DATE(@date_to) AS date_to,
-      (
-        SELECT
-          SUM(client_count)
-        FROM {source_table}
-        WHERE date_from = @date_from AND date_to = @date_to
-      ) AS client_count,
-    """ + ",\n".join(
+    dimension_ctes = ",\n".join(
         [
-            expr_template.format(field=field, dimensions=", ".join(dimensions))
+            cte_template.format(field=field, dimensions=", ".join(dimensions))
             for field, dimensions in output_fields.items()
         ]
     )
+    dimension_joins = "\n".join(
+        [f"JOIN {field}_counts USING (date_from)" for field in output_fields]
+    )
+
+    # Every dimension array partitions all clients, so the total client count is
+    # summed from one of them instead of scanning the source table again.
+    return f"""
+    WITH weeks AS (
+      SELECT
+        date_from,
+        DATE_ADD(date_from, INTERVAL 7 DAY) AS date_to
+      FROM UNNEST(@dates_from) AS date_from
+    ),
+    source AS (
+      SELECT
+        *
+      FROM {source_table}
+      WHERE
+        date_from IN UNNEST(@dates_from)
+        AND date_to = DATE_ADD(date_from, INTERVAL 7 DAY)
+    ),
+    {dimension_ctes}
+    SELECT
+      date_from,
+      date_to,
+      {", ".join(output_fields)},
+      (SELECT SUM(client_count) FROM UNNEST(os)) AS client_count
+    FROM weeks
+    {dimension_joins}
+    ORDER BY date_from DESC
+    """
 
 
-def load_data(bq_client, input_bq_table, date_from, date_to):
-    """Load a set of aggregated metrics for the provided timeframe.
+def load_data(bq_client, input_bq_table, dates_from):
+    """Load a set of aggregated metrics for each of the provided weeks.
 
-    Returns dictionary containing preaggregated user counts per various dimensions.
+    Returns a list of dictionaries, one per week ordered from the latest, containing
+    preaggregated user counts per various dimensions.
 
     Args:
-        date_from: Start date (inclusive)
-        date_to: End date (exclusive)
+        dates_from: Start dates (inclusive) of the weeks to load
     """
     query = get_aggregation_query(input_bq_table)
 
     job_config = bigquery.QueryJobConfig(
         query_parameters=[
-            bigquery.ScalarQueryParameter("date_from", "DATE", date_from),
-            bigquery.ScalarQueryParameter("date_to", "DATE", date_to),
+            bigquery.ArrayQueryParameter("dates_from", "DATE", dates_from),
         ]
     )
     hardware_by_dimensions_query_job = bq_client.query(query, job_config=job_config)
-    hardware_by_dimensions = dict(next(hardware_by_dimensions_query_job.result()))
+    hardware_by_dimensions = [
+        dict(row) for row in hardware_by_dimensions_query_job.result()
+    ]
 
-    if hardware_by_dimensions["client_count"] is None:
+    # weeks without data don't have a row
+    missing_dates = set(dates_from) - {week["date_from"] for week in hardware_by_dimensions}
+    if missing_dates:
         raise ValueError(
-            f"No data in {input_bq_table} for {date_from} to {date_to}"
+            f"No data in {input_bq_table} for weeks starting "
+            f"{', '.join(str(d) for d in sorted(missing_dates))}"
         )
 
     return hardware_by_dimensions
 
 
+def get_dates_from(bq_client, output_bq_table, date_from, past_weeks, force):
+    """Return the start dates of the weeks to aggregate, latest first.
+
+    The week starting at date_from is always included, past weeks that are already
+    in output_bq_table are skipped unless force is set.
+    """
+    dates_from = [
+        date_from - timedelta(weeks=1 * batch_number) for batch_number in range(0, past_weeks + 1)
+    ]
+    if force or past_weeks == 0:
+        return dates_from
+
+    try:
+        existing_dates = {
+            row["date_from"]
+            for row in bq_client.query(
+                f"SELECT DISTINCT date_from FROM {output_bq_table}"
+            ).result()
+        }
+    except NotFound:
+        existing_dates = set()
+
+    past_dates_from = [d for d in dates_from[1:] if d not in existing_dates]
+    skipped = len(dates_from) - 1 - len(past_dates_from)
+    if skipped > 0:
+        logger.info(
+            f"Skipping {skipped} past week(s) already in {output_bq_table}, "
+            "use --force to recompute them"
+        )
+    return dates_from[:1] + past_dates_from
+
+
 def get_os_arch(browser_arch, os_name, is_wow64):
     """Infer the OS arch from environment data.
 
@@ -97,23 +221,11 @@ def get_os_arch(browser_arch, os_name, is_wow64):
         'aarch64' if it's a 64bit ARM OS.
 
     """
-    is_64bit_browser = browser_arch == "x86-64"
-    # If it's a 64bit browser build, then we're on a 64bit system.
-    if is_64bit_browser:
-        return "x86-64"
-
-    is_windows = os_name == "Windows_NT"
-    # If we're on Windows, with a 32bit browser build, and |isWow64 = true|,
-    # then we're on a 64 bit system.
-    if is_windows and is_wow64:
-        return "x86-64"
-
-    is_aarch64_browser = browser_arch == "aarch64"
-    if is_aarch64_browser:
-        return "aarch64"
-
-    # Otherwise we're probably on a 32 bit system.
-    return "x86"
+    is_windows_wow64 = os_name == "Windows_NT" and bool(is_wow64)
+    # Otherwise we're probably on a 32 bit system, unless running under WOW64.
+    return OS_ARCH_MAP.get(
+        (browser_arch, is_windows_wow64), "x86-64" if is_windows_wow64 else "x86"
+    )
 
 
 def get_gpu_vendor_name(gpu_vendor_id):
@@ -127,21 +239,6 @@ def get_gpu_vendor_name(gpu_vendor_id):
       unknown.
 
     """
-    GPU_VENDOR_MAP = {
-        "0x1013": "Cirrus Logic",
-        "0x1002": "AMD",
-        "0x8086": "Intel",
-        "Intel Open Source Technology Center": "Intel",
-        "0x5333": "S3 Graphics",
-        "0x1039": "SIS",
-        "0x1106": "VIA",
-        "0x10de": "NVIDIA",
-        "0x102b": "Matrox",
-        "0x15ad": "VMWare",
-        "0x80ee": "Oracle VirtualBox",
-        "0x1414": "Microsoft Basic",
-        "0x106b": "Apple",
-    }
     return GPU_VENDOR_MAP.get(gpu_vendor_id, "Other")
 
 
@@ -157,13 +254,7 @@ def get_device_family_chipset(vendor_id, device_id, device_map):
         or "Other" if unknown.
 
     """
-    if vendor_id not in device_map:
-        return "Other"
-
-    if device_id not in device_map[vendor_id]:
-        return "Other"
-
-    return "-".join(device_map[vendor_id][device_id])
+    return device_map.get(vendor_id, {}).get(device_id, "Other")
 
 
 def invert_device_map(m):
@@ -172,7 +263,7 @@ def invert_device_map(m):
     The layout of the fetched GPU map layout is:
         Vendor ID -> Device Family -> Chipset -> [Device IDs]
     We should convert it to:
-        Vendor ID -> Device ID -> [Device Family, Chipset]
+        Vendor ID -> Device ID -> "Device Family-Chipset"
 
     """
     device_id_map = {}
@@ -180,15 +271,44 @@ def invert_device_map(m):
         device_id_map["0x" + vendor] = {}
         for family, v in u.items():
             for chipset, ids in v.items():
+                family_chipset = f"{family}-{chipset}"
                 device_id_map["0x" + vendor].update(
-                    {("0x" + gfx_id): [family, chipset] for gfx_id in ids}
+                    {("0x" + gfx_id): family_chipset for gfx_id in ids}
                 )
     return device_id_map
 
 
+def read_cached_response(cache_path):
+    """Return the (etag, body) pair cached at cache_path, or None if there isn't one."""
+    try:
+        with open(cache_path + ".etag") as etag_file:
+            etag = etag_file.read()
+        with open(cache_path, "rb") as body_file:
+            return etag, body_file.read()
+    except OSError:
+        return None
+
+
+def write_cached_response(cache_path, etag, body):
+    """Cache a response body and its etag at cache_path, a failure to do so is not fatal."""
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        # write each file next to its destination and move it into place, so an
+        # interrupted write never leaves a truncated file behind
+        for path, content in ((cache_path, body), (cache_path + ".etag", etag.encode())):
+            with open(path + ".tmp", "wb") as tmp_file:
+                tmp_file.write(content)
+            os.replace(path + ".tmp", path)
+    except OSError as e:
+        logger.warning(f"Unable to cache response to {cache_path}: {e}")
+
+
 def fetch_json(uri):
     """Perform an HTTP GET on the given uri, return the results as json.
 
+    Responses are cached on disk with their ETag. Subsequent fetches send
+    If-None-Match and reuse the cached body when the server reports it unchanged.
+
     If there is an error fetching the data, raise an exception.
 
     Args:
@@ -198,28 +318,38 @@ def fetch_json(uri):
         A JSON object with the response.
 
     """
-    data = requests.get(uri)
+    cache_path = os.path.join(FETCH_CACHE_DIR, hashlib.sha1(uri.encode()).hexdigest())
+    cached = read_cached_response(cache_path)
+    headers = {"If-None-Match": cached[0]} if cached is not None else {}
+
+    data = requests.get(uri, headers=headers)
+    if cached is not None and data.status_code == 304:
+        try:
+            return orjson.loads(cached[1])
+        except orjson.JSONDecodeError:
+            logger.warning(f"Discarding unreadable cached response for {uri}")
+            data = requests.get(uri)
+
     # Raise an exception if the fetch failed.
     data.raise_for_status()
-    return data.json()
+    if "ETag" in data.headers:
+        write_cached_response(cache_path, data.headers["ETag"], data.content)
+    return orjson.loads(data.content)
 
 
+@functools.lru_cache(maxsize=1)
 def build_device_map():
     """Build a dictionary that will help us map vendor/device ids to device families."""
-    intel_raw = fetch_json("https://github.com/jrmuizel/gpu-db/raw/master/intel.json")
-    nvidia_raw = fetch_json("https://github.com/jrmuizel/gpu-db/raw/master/nvidia.json")
-    amd_raw = fetch_json("https://github.com/jrmuizel/gpu-db/raw/master/amd.json")
-
     device_map = {}
-    device_map.update(invert_device_map(intel_raw))
-    device_map.update(invert_device_map(nvidia_raw))
-    device_map.update(invert_device_map(amd_raw))
+    for uri in DEVICE_MAP_URIS:
+        device_map.update(invert_device_map(fetch_json(uri)))
 
     return device_map
 
 
 def transform_dimensions(
-    hardware_by_dimensions: Dict[str, List[Dict[str, Any]]]
+    hardware_by_dimensions: Dict[str, List[Dict[str, Any]]],
+    device_map: Dict[str, Dict[str, str]],
 ) -> Dict[str, Dict[str, int]]:
     """Transform compound dimensions into the desired values.
 
@@ -227,25 +357,6 @@ def transform_dimensions(
 
     Returns a dict of {dimension_name: {value: client_count}}
     """
-    device_map = build_device_map()
-
-    untransformed_dimensions = [
-        "os",
-        "browser_arch",
-        "cpu_cores",
-        "cpu_vendor",
-        "resolution",
-        "memory_gb",
-        "has_flash",
-        "cpu_speed",
-    ]
-
-    def untransformed(dim):
-        return {
-            dim_value[dim]: dim_value["client_count"]
-            for dim_value in hardware_by_dimensions[dim]
-        }
-
     os_arch_count = defaultdict(int)
     gfx_vendor_count = defaultdict(int)
     gfx_model_count = defaultdict(int)
@@ -268,7 +379,13 @@ def transform_dimensions(
         ] += gfx_model["client_count"]
 
     return {
-        **{dim: untransformed(dim) for dim in untransformed_dimensions},
+        **{
+            dim: {
+                dim_value[dim]: dim_value["client_count"]
+                for dim_value in hardware_by_dimensions[dim]
+            }
+            for dim in UNTRANSFORMED_DIMENSIONS
+        },
         "os_arch": dict(os_arch_count),
         "gfx0_vendor_name": dict(gfx_vendor_count),
         "gfx0_model": dict(gfx_model_count),
@@ -279,88 +396,76 @@ def collapse_buckets(aggregated_data, count_threshold, sample_count):
     """Group keys that have less than count_threshold into an "Other" bucket."""
     OTHER_KEY = "Other"
 
-    # low-cardinality dimensions to not create an "other" bucket for
-    uncollapsed_dimensions = [
-        "has_flash",
-        "os_arch",
-    ]
-
-    collapsed_groups = {}
+    ratios = {}
     for dimension, counts in aggregated_data.items():
-        collapsed_counts = {}
+        # per-dimension checks, hoisted out of the per-value loop
+        is_collapsible = dimension not in UNCOLLAPSED_DIMENSIONS
+        is_os = dimension == "os"
+        is_resolution = dimension == "resolution"
+
+        collapsed_counts = defaultdict(int)
+        generic_os_keys = set()
         for k, v in counts.items():
-            if dimension == "resolution" and k == "0x0":
-                collapsed_counts[OTHER_KEY] = collapsed_counts.get(OTHER_KEY, 0) + v
-            elif v < count_threshold and dimension not in uncollapsed_dimensions:
-                if dimension == "os":
+            if is_resolution and k == "0x0":
+                collapsed_counts[OTHER_KEY] += v
+            elif is_collapsible and v < count_threshold:
+                if is_os:
                     # create generic key per os name
-                    [os, ver] = k.split("-", 1)
-                    generic_os_key = os + "-" + "Other"
-                    collapsed_counts[generic_os_key] = (
-                        collapsed_counts.get(generic_os_key, 0) + v
-                    )
+                    [os_name, ver] = k.split("-", 1)
+                    generic_os_key = os_name + "-" + "Other"
+                    collapsed_counts[generic_os_key] += v
+                    generic_os_keys.add(generic_os_key)
                 else:
-                    collapsed_counts[OTHER_KEY] = collapsed_counts.get(OTHER_KEY, 0) + v
+                    collapsed_counts[OTHER_KEY] += v
             else:
-                collapsed_counts[k] = collapsed_counts.get(k, 0) + v
-        if dimension == "os":
-            # The previous grouping might have created additional os groups.
-            # Let's check again.
-            final_collapsed = {}
-            for k, v in collapsed_counts.items():
-                if v < count_threshold:
-                    final_collapsed[OTHER_KEY] = final_collapsed.get(OTHER_KEY, 0) + v
-                else:
-                    final_collapsed[k] = v
-            collapsed_counts = final_collapsed
-        collapsed_groups[dimension] = collapsed_counts
+                collapsed_counts[k] += v
+        # The previous grouping might have created additional os groups that are
+        # still below the threshold. Only those need checking again.
+        for generic_os_key in generic_os_keys:
+            if collapsed_counts[generic_os_key] < count_threshold:
+                collapsed_counts[OTHER_KEY] += collapsed_counts.pop(generic_os_key)
 
-    ratios = {}
-    for dimension, counts in collapsed_groups.items():
         ratios[dimension] = {
-            str(metric): count / float(sample_count) for metric, count in counts.items()
+            str(metric): count / sample_count for metric, count in collapsed_counts.items()
         }
 
     return ratios
 
 
-def flatten_aggregates(aggregates: List[Dict]):
-    keys_translation = {
-        "browser_arch": "browserArch_",
-        "cpu_cores": "cpuCores_",
-        "cpu_vendor": "cpuVendor_",
-        "cpu_speed": "cpuSpeed_",
-        "gfx0_vendor_name": "gpuVendor_",
-        "gfx0_model": "gpuModel_",
-        "resolution": "resolution_",
-        "memory_gb": "ram_",
-        "os": "osName_",
-        "os_arch": "osArch_",
-        "has_flash": "hasFlash_",
-    }
+# Output key prefix for each aggregated dimension
+KEYS_TRANSLATION = {
+    "browser_arch": "browserArch_",
+    "cpu_cores": "cpuCores_",
+    "cpu_vendor": "cpuVendor_",
+    "cpu_speed": "cpuSpeed_",
+    "gfx0_vendor_name": "gpuVendor_",
+    "gfx0_model": "gpuModel_",
+    "resolution": "resolution_",
+    "memory_gb": "ram_",
+    "os": "osName_",
+    "os_arch": "osArch_",
+    "has_flash": "hasFlash_",
+}
+
+
+def flatten_aggregates(aggregates: Iterable[Mapping[str, Any]]):
     flattened_list = []
     for aggregate in aggregates:
         flattened = {}
         for metric, values in aggregate.items():
-            if metric in keys_translation:
-                for kv_pair in values:
-                    flattened[keys_translation[metric] + str(kv_pair["key"])] = kv_pair["value"]
-        flattened["date"] = aggregate["date_from"].isoformat()
+            prefix = KEYS_TRANSLATION.get(metric)
+            if prefix is None:
+                continue
+            for kv_pair in values:
+                flattened[f"{prefix}{kv_pair['key']}"] = kv_pair["value"]
+        # serialized as YYYY-MM-DD by orjson
+        flattened["date"] = aggregate["date_from"]
         flattened_list.append(flattened)
     return flattened_list
 
 
-def upload_data_gcs(
-    output_data: List[Dict], gcs_bucket: str, gcs_path: str, dryrun: bool
-):
-    aggregates_flattened = sorted(
-        flatten_aggregates(output_data), key=lambda a: a["date"], reverse=True
-    )
-    aggregates_flattened_json = json.dumps(aggregates_flattened, indent=4)
-
-    with open("hwsurvey-weekly.json", "w") as output_file:
-        output_file.write(aggregates_flattened_json)
-
+def upload_data_gcs(output_json: bytes, gcs_bucket: str, gcs_path: str, dryrun: bool):
+    """Upload the serialized report to GCS, as the latest and as a dated archive copy."""
     # Store dataset to GCS. Since GCS doesn't support symlinks, make
     # two copies of the file: one will always contain the latest data,
     # the other for archiving.
@@ -372,13 +477,13 @@ def upload_data_gcs(
         logger.info(f"Uploading data to gcs bucket: {gcs_bucket}, path: {gcs_path}")
 
         storage_client = storage.Client()
-        bucket = storage_client.bucket(gcs_bucket)
-
-        blob_archive = bucket.blob(gcs_path + archived_file_copy)
-        blob_archive.upload_from_filename("hwsurvey-weekly.json")
-
-        blob_latest = bucket.blob(gcs_path + "hwsurvey-weekly.json")
-        blob_latest.upload_from_filename("hwsurvey-weekly.json")
+        upload_blobs(
+            storage_client.bucket(gcs_bucket),
+            [
+                (gcs_path + archived_file_copy, output_json),
+                (gcs_path + "hwsurvey-weekly.json", output_json),
+            ],
+        )
 
 
 @click.command()
@@ -413,7 +518,15 @@ def upload_data_gcs(
     is_flag=True,
     help="If dry run is set, data will not be uploaded to GCS",
 )
-def main(date_from, input_bq_table, output_bq_table, gcs_bucket, gcs_path, past_weeks, dry_run):
+@click.option(
+    "--force",
+    default=False,
+    is_flag=True,
+    help="Recompute past weeks even if they are already in the output table",
+)
+def main(
+    date_from, input_bq_table, output_bq_table, gcs_bucket, gcs_path, past_weeks, dry_run, force
+):
     """Generate weekly hardware report for [date_from, date_from + 7) timeframe.
 
     Aggregates are incrementally inserted to provided BigQuery table,
@@ -424,19 +537,25 @@ def main(date_from, input_bq_table, output_bq_table, gcs_bucket, gcs_path, past_
 
     bq_client = bigquery.Client()
 
-    for batch_number in range(0, past_weeks + 1):
+    load_config = bigquery.LoadJobConfig()
+    load_config.write_disposition = bigquery.job.WriteDisposition.WRITE_TRUNCATE
+    load_jobs = deque()
+
+    dates_from = get_dates_from(bq_client, output_bq_table, date_from, past_weeks, force)
+    logger.info(f"Loading data for {len(dates_from)} week(s) starting from {dates_from[-1]}")
+    weekly_hardware_by_dimensions = load_data(bq_client, input_bq_table, dates_from)
+    device_map = build_device_map()
+
+    for batch_number, hardware_by_dimensions in enumerate(weekly_hardware_by_dimensions):
         # generate aggregates
-        batch_date_from = date_from - timedelta(weeks=1 * batch_number)
-        batch_date_to = batch_date_from + timedelta(days=7)
+        batch_date_from = hardware_by_dimensions["date_from"]
+        batch_date_to = hardware_by_dimensions["date_to"]
         logger.info(
-            f"Running batch {batch_number + 1}/{past_weeks + 1}, "
+            f"Running batch {batch_number + 1}/{len(dates_from)}, "
             f"timeframe: [{batch_date_from}, {batch_date_to})"
         )
-        hardware_by_dimensions = load_data(
-            bq_client, input_bq_table, batch_date_from, batch_date_to
-        )
 
-        transformed = transform_dimensions(hardware_by_dimensions)
+        transformed = transform_dimensions(hardware_by_dimensions, device_map)
 
         # Collapse together groups that count less than 1% of our samples.
         threshold_to_collapse = int(hardware_by_dimensions["client_count"] * 0.01)
@@ -447,29 +566,45 @@ def main(date_from, input_bq_table, output_bq_table, gcs_bucket, gcs_path, past_
 
         # convert to bigquery row format
         for dimension in percentages:
-            kv_array = []
-            for value, count in percentages[dimension].items():
-                kv_array.append({"key": value, "value": count})
-            percentages[dimension] = sorted(kv_array, key=lambda x: x["key"])
+            percentages[dimension] = [
+                {"key": value, "value": count}
+                for value, count in sorted(percentages[dimension].items())
+            ]
 
         percentages["date_from"] = batch_date_from.isoformat()
         percentages["date_to"] = batch_date_to.isoformat()
 
-        # save to BQ
-        load_config = bigquery.LoadJobConfig()
-        load_config.write_disposition = bigquery.job.WriteDisposition.WRITE_TRUNCATE
-        bq_client.load_table_from_json(
-            json_rows=[percentages],
-            destination=f"{output_bq_table}${batch_date_from:%Y%m%d}",
-            job_config=load_config,
-        ).result()
-
-    output_data = [
-        dict(row) for row in
-        bq_client.query(f"SELECT * FROM {output_bq_table} ORDER BY date_from").result()
-    ]
+        # save to BQ, each week overwrites its own partition so the load jobs
+        # are independent and can run while the next batch is computed
+        if len(load_jobs) >= MAX_PENDING_LOAD_JOBS:
+            load_jobs.popleft().result()
+        load_jobs.append(
+            bq_client.load_table_from_json(
+                json_rows=[percentages],
+                destination=f"{output_bq_table}${batch_date_from:%Y%m%d}",
+                job_config=load_config,
+            )
+        )
+
+    for load_job in load_jobs:
+        load_job.result()
+
+    output_data = (
+        bq_client.query(f"SELECT * FROM {output_bq_table} ORDER BY date_from")
+        .result()
+        .to_arrow(create_bqstorage_client=True)
+        .to_pylist()
+    )
+    aggregates_flattened = sorted(
+        flatten_aggregates(output_data), key=lambda a: a["date"], reverse=True
+    )
 
-    upload_data_gcs(output_data, gcs_bucket, gcs_path, dry_run)
+    upload_data_gcs(
+        orjson.dumps(aggregates_flattened, option=orjson.OPT_INDENT_2),
+        gcs_bucket,
+        gcs_path,
+        dry_run,
+    )
 
 
 if __name__ == "__main__":
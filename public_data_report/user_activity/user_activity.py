@@ -1,10 +1,11 @@
-import json
 import logging
+from collections import defaultdict
 
 import click
+import orjson
 from google.cloud import bigquery, storage
 
-from public_data_report import USER_ACITVITY_COUNTRY_LIST
+from public_data_report import USER_ACITVITY_COUNTRY_LIST, upload_blobs
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -36,34 +37,29 @@ def main(bq_table, gcs_bucket, gcs_path):
     """
 
     query_job = client.query(QUERY)
-    rows = query_job.result()
+    # read through the BigQuery Storage API as Arrow, rows become plain dicts
+    rows = query_job.result().to_arrow(create_bqstorage_client=True).to_pylist()
 
-    user_activity_metrics = {}
-    web_usage_metrics = {}
+    user_activity_metrics = defaultdict(list)
+    web_usage_metrics = defaultdict(list)
 
     for row in rows:
-        if (
-            row.country_name not in user_activity_metrics
-            and row.country_name not in web_usage_metrics
-        ):
-            user_activity_metrics[row.country_name] = []
-            web_usage_metrics[row.country_name] = []
-
-        user_activity_metrics[row.country_name].append(
+        country_name = row["country_name"]
+        user_activity_metrics[country_name].append(
             {
-                "date": row.date,
+                "date": row["date"],
                 "metrics": {
-                    "avg_intensity": float(row.intensity),
-                    "MAU": row.mau * 100,
-                    "avg_daily_usage(hours)": float(row.avg_hours_usage_daily),
-                    "pct_new_user": float(row.new_profile_rate) * 100,
-                    "pct_latest_version": float(row.latest_version_ratio) * 100,
+                    "avg_intensity": float(row["intensity"]),
+                    "MAU": row["mau"] * 100,
+                    "avg_daily_usage(hours)": float(row["avg_hours_usage_daily"]),
+                    "pct_new_user": float(row["new_profile_rate"]) * 100,
+                    "pct_latest_version": float(row["latest_version_ratio"]) * 100,
                 },
             }
         )
-        web_usage_metrics[row.country_name].append(
+        web_usage_metrics[country_name].append(
             {
-                "date": row.date,
+                "date": row["date"],
                 "metrics": {
                     "locale": {
                         locale["locale"]: locale["ratio"] * 100 for locale in row["top_locales"]
@@ -78,12 +74,9 @@ def main(bq_table, gcs_bucket, gcs_path):
 
     # validate country list
     country_allowlist = set(USER_ACITVITY_COUNTRY_LIST)
-    missing_countries = country_allowlist - (
-        set(web_usage_metrics.keys()) | web_usage_metrics.keys()
-    )
-    unexpected_countries = (
-        set(web_usage_metrics.keys()) | web_usage_metrics.keys()
-    ) - country_allowlist
+    output_countries = user_activity_metrics.keys() | web_usage_metrics.keys()
+    missing_countries = country_allowlist - output_countries
+    unexpected_countries = output_countries - country_allowlist
     errors = []
     if len(missing_countries) > 0:
         errors.append(f"Expected countries missing: {missing_countries}")
@@ -95,18 +88,21 @@ def main(bq_table, gcs_bucket, gcs_path):
         raise RuntimeError(f"Invalid countries in output: {', '.join(errors)}")
 
     storage_client = storage.Client()
-    bucket = storage_client.bucket(gcs_bucket)
-
-    for json_data, filename in [
-        (user_activity_metrics, "fxhealth.json"),
-        (web_usage_metrics, "webusage.json"),
-    ]:
-        json.dumps(user_activity_metrics, indent=4)
-        blob = bucket.blob(f"{gcs_path}/{filename}")
-        blob.upload_from_string(
-            json.dumps(json_data, indent=4), content_type="application/json"
-        )
-        logging.info(f"Uploaded {blob.size} bytes to {bucket.name}/{blob.name}")
+    # locale and add-on names are not filtered for NULL, a None key is written as "null"
+    json_options = orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS
+    upload_blobs(
+        storage_client.bucket(gcs_bucket),
+        [
+            (
+                f"{gcs_path}/fxhealth.json",
+                orjson.dumps(user_activity_metrics, option=json_options),
+            ),
+            (
+                f"{gcs_path}/webusage.json",
+                orjson.dumps(web_usage_metrics, option=json_options),
+            ),
+        ],
+    )
 
 
 if __name__ == "__main__":
@@ -12,8 +12,9 @@ setup(
     include_package_data=True,
     install_requires=[
         "click == 7.1.1",
-        "google-cloud-bigquery == 3.11.4",
+        "google-cloud-bigquery[bqstorage] == 3.11.4",
         "google-cloud-storage == 2.7.0",
+        "orjson == 3.9.7",
         "requests == 2.23.0",
     ],
 )
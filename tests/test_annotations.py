@@ -1,8 +1,16 @@
 import json
+from datetime import datetime
+from decimal import Decimal
 from unittest import mock
 
+import pyarrow as pa
+
 from public_data_report import USER_ACITVITY_COUNTRY_LIST
-from public_data_report.annotations.annotations import get_usage_annotations
+from public_data_report.annotations.annotations import (
+    _build_usage_annotations,
+    get_fxhealth_annotations,
+    get_usage_annotations,
+)
 
 
 @mock.patch(
@@ -13,11 +21,12 @@ from public_data_report.annotations.annotations import get_usage_annotations
     "public_data_report.annotations.annotations.USER_ACITVITY_COUNTRY_LIST",
     ["Brazil", "Canada", "France"],
 )
-@mock.patch("public_data_report.annotations.annotations.json")
-def test_default_annotations(mock_json):
+@mock.patch("public_data_report.annotations.annotations._read_static_annotations")
+def test_default_annotations(mock_read_static_annotations):
     """Default annotations should be appended to each country in annotations_webusage.json."""
-    mock_json.loads.return_value = {"Brazil": [{"annotation": "123"}]}
-    mock_json.dumps = json.dumps
+    mock_read_static_annotations.return_value = json.dumps(
+        {"Brazil": [{"annotation": "123"}]}
+    ).encode()
 
     actual = get_usage_annotations()
 
@@ -36,14 +45,49 @@ def test_default_annotations(mock_json):
         },
         indent=2,
         sort_keys=True,
-    )
+    ).encode()
 
     assert actual == expected
 
 
+@mock.patch(
+    "public_data_report.annotations.annotations.USER_ACITVITY_COUNTRY_LIST",
+    ["Brazil", "Canada"],
+)
+@mock.patch("public_data_report.annotations.annotations.bigquery")
+def test_fxhealth_annotations(mock_bigquery):
+    """NUMERIC versions should be published as whole major versions."""
+    query_result = mock_bigquery.Client.return_value.query.return_value.result.return_value
+    query_result.to_arrow.return_value = pa.table(
+        {
+            "day": ["2022-05-02", "2022-04-04"],
+            "version": pa.array(
+                [Decimal("100"), Decimal("99")], type=pa.decimal128(38, 9)
+            ),
+        }
+    )
+
+    actual = json.loads(get_fxhealth_annotations(datetime(2022, 5, 2)))
+
+    expected_annotations = [
+        {"annotation": {"pct_latest_version": "FF100"}, "date": "2022-05-02"},
+        {"annotation": {"pct_latest_version": "FF99"}, "date": "2022-04-04"},
+    ]
+    assert actual == {"Brazil": expected_annotations, "Canada": expected_annotations}
+
+
 def test_usage_annotations_countries():
     """Countries in annotations_webusage should exactly match the USER_ACITVITY_COUNTRY_LIST."""
-    actual = json.loads(get_usage_annotations()).keys()
+    actual = _build_usage_annotations().keys()
 
     assert len(actual) == len(USER_ACITVITY_COUNTRY_LIST)
     assert set(actual) == set(USER_ACITVITY_COUNTRY_LIST)
+
+
+def test_usage_annotations_not_shared():
+    """Repeated builds should not see defaults appended by earlier builds."""
+    first = _build_usage_annotations()
+    second = _build_usage_annotations()
+
+    assert first == second
+    assert first is not second
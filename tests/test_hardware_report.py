@@ -1,26 +1,64 @@
+from datetime import date
 from unittest import mock
 
+import pytest
+
 from public_data_report.hardware_report import hardware_report
 
 DEVICE_MAP_SAMPLE = {
   "0x10de": {
-    "0x13c1": [
-      "Maxwell",
-      "GM204"
-    ],
-    "0x13c2": [
-      "Maxwell",
-      "GM204"
-    ],
-    "0x13d7": [
-      "Maxwell",
-      "GM204M"
-    ]
+    "0x13c1": "Maxwell-GM204",
+    "0x13c2": "Maxwell-GM204",
+    "0x13d7": "Maxwell-GM204M"
   }
 }
 
 
-def test_hardware_report_helpers():
+def test_load_data_missing_weeks():
+    """Weeks without any input data should fail the job."""
+    bq_client = mock.Mock()
+    bq_client.query.return_value.result.return_value = [
+        {"date_from": date(2020, 1, 8), "client_count": 10},
+    ]
+
+    weeks = hardware_report.load_data(bq_client, "table", [date(2020, 1, 8)])
+    assert weeks == [{"date_from": date(2020, 1, 8), "client_count": 10}]
+
+    with pytest.raises(ValueError, match="2020-01-01"):
+        hardware_report.load_data(bq_client, "table", [date(2020, 1, 8), date(2020, 1, 1)])
+
+
+def test_get_dates_from():
+    """Past weeks already in the output table should only be recomputed when forced."""
+    bq_client = mock.Mock()
+    bq_client.query.return_value.result.return_value = [
+        {"date_from": date(2020, 1, 15)},
+        {"date_from": date(2020, 1, 8)},
+    ]
+
+    assert hardware_report.get_dates_from(bq_client, "table", date(2020, 1, 15), 2, False) == [
+        date(2020, 1, 15),
+        date(2020, 1, 1),
+    ]
+    assert hardware_report.get_dates_from(bq_client, "table", date(2020, 1, 15), 2, True) == [
+        date(2020, 1, 15),
+        date(2020, 1, 8),
+        date(2020, 1, 1),
+    ]
+    assert hardware_report.get_dates_from(bq_client, "table", date(2020, 1, 15), 0, False) == [
+        date(2020, 1, 15),
+    ]
+    assert bq_client.query.call_count == 1
+
+
+@pytest.fixture
+def device_map():
+    """Inverted device map with a single known vendor and two devices."""
+    device_data = {"feee": {"family": {"chipset": ["d1d1", "d2d2"]}}}
+    return hardware_report.invert_device_map(device_data)
+
+
+def test_hardware_report_helpers(device_map):
     """Test if helper functions work as expected."""
     # Does |get_os_arch| work as expected?
     assert (
@@ -38,6 +76,12 @@ def test_hardware_report_helpers():
     assert (
         hardware_report.get_os_arch("x86-64", "Windows_NT", False) == "x86-64"
     ), "get_os_arch should report an 'x86-64' for an x86-64 browser on Windows platforms."
+    assert (
+        hardware_report.get_os_arch("aarch64", "Darwin", False) == "aarch64"
+    ), "get_os_arch should report an 'aarch64' for an aarch64 browser."
+    assert (
+        hardware_report.get_os_arch(None, "Linux", False) == "x86"
+    ), "get_os_arch should report an 'x86' for an unknown browser arch."
 
     # Does |get_gpu_vendor_name| behave correctly?
     assert (
@@ -48,8 +92,7 @@ def test_hardware_report_helpers():
     ), "get_gpu_vendor_name must report 'Other' for an unknown vendor id."
 
     # Make sure |invert_device_map| works as expected.
-    device_data = {"feee": {"family": {"chipset": ["d1d1", "d2d2"]}}}
-    inverted_device_data = hardware_report.invert_device_map(device_data)
+    inverted_device_data = device_map
     assert (
         "0xfeee" in inverted_device_data
     ), "The vendor id must be prefixed with '0x' and be at the root of the map."
@@ -60,13 +103,11 @@ def test_hardware_report_helpers():
         device_id in inverted_device_data["0xfeee"]
         for device_id in ("0xd1d1", "0xd2d2")
     ), "The '0xfeee' vendor must contain the expected devices."
-    assert all(
-        d in inverted_device_data["0xfeee"]["0xd1d1"] for d in ("family", "chipset")
-    ), "The family and chipset data must be reported in the device section."
+    assert (
+        inverted_device_data["0xfeee"]["0xd1d1"] == "family-chipset"
+    ), "The family and chipset data must be reported as '<family>-<chipset>' for the device."
 
     # Let's test |get_device_family_chipset|.
-    global device_map
-    device_map = inverted_device_data
     assert (
         hardware_report.get_device_family_chipset("0xfeee", "0xd1d1", device_map)
         == "family-chipset"
@@ -84,10 +125,57 @@ def test_hardware_report_helpers():
     ), "Unknown families must be reported as 'Other'."
 
 
-@mock.patch("public_data_report.hardware_report.hardware_report.build_device_map")
-def test_transform_dimensions(mock_device_map):
-    mock_device_map.return_value = DEVICE_MAP_SAMPLE
+@mock.patch("public_data_report.hardware_report.hardware_report.requests")
+def test_fetch_json_cache(mock_requests, tmp_path):
+    """Unchanged documents should be revalidated with their ETag and read from the cache."""
+    body = b'{"10de": {"Maxwell": {"GM204": ["13c1"]}}}'
+    mock_requests.get.return_value = mock.Mock(
+        status_code=200, headers={"ETag": '"abc"'}, content=body
+    )
+
+    with mock.patch(
+        "public_data_report.hardware_report.hardware_report.FETCH_CACHE_DIR", str(tmp_path)
+    ):
+        fetched = hardware_report.fetch_json("https://example.com/gpu.json")
+        mock_requests.get.assert_called_with("https://example.com/gpu.json", headers={})
+
+        mock_requests.get.return_value = mock.Mock(status_code=304, headers={}, content=b"")
+        assert hardware_report.fetch_json("https://example.com/gpu.json") == fetched
+        mock_requests.get.assert_called_with(
+            "https://example.com/gpu.json", headers={"If-None-Match": '"abc"'}
+        )
+
+    assert fetched == {"10de": {"Maxwell": {"GM204": ["13c1"]}}}
+
+
+@mock.patch("public_data_report.hardware_report.hardware_report.requests")
+def test_fetch_json_corrupt_cache(mock_requests, tmp_path):
+    """An unreadable cached body should be refetched without If-None-Match."""
+    body = b'{"10de": {"Maxwell": {"GM204": ["13c1"]}}}'
+    with mock.patch(
+        "public_data_report.hardware_report.hardware_report.FETCH_CACHE_DIR", str(tmp_path)
+    ):
+        mock_requests.get.return_value = mock.Mock(
+            status_code=200, headers={"ETag": '"abc"'}, content=body
+        )
+        hardware_report.fetch_json("https://example.com/gpu.json")
+        [cache_path] = [str(p) for p in tmp_path.iterdir() if p.suffix != ".etag"]
+        # simulate a body truncated by an interrupted write
+        with open(cache_path, "wb") as body_file:
+            body_file.write(body[:10])
+
+        mock_requests.get.side_effect = [
+            mock.Mock(status_code=304, headers={}, content=b""),
+            mock.Mock(status_code=200, headers={"ETag": '"def"'}, content=body),
+        ]
+        fetched = hardware_report.fetch_json("https://example.com/gpu.json")
+
+    assert fetched == {"10de": {"Maxwell": {"GM204": ["13c1"]}}}
+    mock_requests.get.assert_called_with("https://example.com/gpu.json")
+    assert hardware_report.read_cached_response(cache_path) == ('"def"', body)
 
+
+def test_transform_dimensions():
     test_data = {
         "browser_arch": [{"browser_arch": "x86-64", "client_count": 6}],
         "os": [
@@ -139,7 +227,7 @@ def test_transform_dimensions(mock_device_map):
         ],
     }
 
-    transformed = hardware_report.transform_dimensions(test_data)
+    transformed = hardware_report.transform_dimensions(test_data, DEVICE_MAP_SAMPLE)
 
     transformed_expected = {
         "os": {"Windows_NT-10.0": 1, "Windows_NT-6.2": 5},
@@ -190,11 +278,24 @@ def test_collapse_buckets():
     assert collapsed == collapsed_expected
 
 
+def test_collapse_buckets_os():
+    """Small os versions should be grouped per os name, then into "Other" if still small."""
+    aggregated = {
+        "os": {"Windows_NT-10.0": 80, "Darwin-19.0": 6, "Darwin-18.0": 5, "Linux-5.4": 9},
+    }
+    collapsed_expected = {
+        "os": {"Windows_NT-10.0": 0.8, "Darwin-Other": 0.11, "Other": 0.09},
+    }
+    collapsed = hardware_report.collapse_buckets(aggregated, 10, 100)
+
+    assert collapsed == collapsed_expected
+
+
 @mock.patch("public_data_report.hardware_report.hardware_report.storage")
 def test_upload_dryrun(mock_gcs):
     """"Dry run should not try to upload to GCS."""
-    hardware_report.upload_data_gcs([], "", "", dryrun=True)
+    hardware_report.upload_data_gcs(b"[]", "", "", dryrun=True)
     assert mock_gcs.Client.call_count == 0
 
-    hardware_report.upload_data_gcs([], "", "", dryrun=False)
+    hardware_report.upload_data_gcs(b"[]", "", "", dryrun=False)
     assert mock_gcs.Client.call_count == 1
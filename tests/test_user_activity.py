@@ -0,0 +1,45 @@
+import json
+from unittest import mock
+
+from click.testing import CliRunner
+
+from public_data_report.user_activity import user_activity
+
+
+@mock.patch(
+    "public_data_report.user_activity.user_activity.USER_ACITVITY_COUNTRY_LIST",
+    ["Brazil"],
+)
+@mock.patch("public_data_report.user_activity.user_activity.storage")
+@mock.patch("public_data_report.user_activity.user_activity.bigquery")
+def test_export_null_locale_and_addon_name(mock_bigquery, mock_storage):
+    """NULL locales and add-on names should be exported as "null" keys."""
+    query_result = mock_bigquery.Client.return_value.query.return_value.result.return_value
+    query_result.to_arrow.return_value.to_pylist.return_value = [
+        {
+            "date": "2020-01-05",
+            "country_name": "Brazil",
+            "mau": 10,
+            "avg_hours_usage_daily": 1.5,
+            "intensity": 0.5,
+            "new_profile_rate": 0.1,
+            "latest_version_ratio": 0.2,
+            "top_addons": [{"addon_name": None, "ratio": 0.25}],
+            "has_addon_ratio": 0.5,
+            "top_locales": [{"locale": None, "ratio": 0.75}],
+        }
+    ]
+    mock_bucket = mock_storage.Client.return_value.bucket.return_value
+    blobs = {}
+    mock_bucket.blob.side_effect = lambda name: blobs.setdefault(name, mock.Mock())
+
+    result = CliRunner().invoke(
+        user_activity.main,
+        ["--bq_table", "table", "--gcs_bucket", "bucket", "--gcs_path", "path"],
+    )
+
+    assert result.exit_code == 0, result.output
+    [webusage_json], _ = blobs["path/webusage.json"].upload_from_string.call_args
+    metrics = json.loads(webusage_json)["Brazil"][0]["metrics"]
+    assert metrics["locale"] == {"null": 75.0}
+    assert metrics["top10addons"] == {"null": 25.0}